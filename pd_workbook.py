@@ -0,0 +1,40 @@
+"""Column schema and save helper shared by the PD sheet Streamlit apps"""
+
+import io
+from operator import itemgetter
+from zipfile import ZipFile, ZIP_DEFLATED
+from openpyxl.utils import get_column_letter
+from openpyxl.writer.excel import ExcelWriter
+
+HEADERS = (
+    "Name/Term", "LGD", "% RR Used", "% AGG Used", "Used",
+    "Available", "Total Exposure", "% TE of RR", "% TE of AGG"
+)
+
+# Column letters for the nine output columns, worked out once at import
+COLUMN_LETTERS = tuple(get_column_letter(col_num) for col_num in range(1, len(HEADERS) + 1))
+
+# JSON metric keys, in the same order as the metric columns
+METRIC_KEYS = (
+    "percentRRUsed", "percentAGGUsed", "used", "available",
+    "totalExposure", "percentTERR", "percentTEAGG"
+)
+# Pulls all metric values out of a metrics dict as one tuple, in column order
+get_metrics = itemgetter(*METRIC_KEYS)
+
+# Deflate level for downloads; level 1 trades a slightly larger file for a faster save
+ZIP_LEVEL = 1
+
+def save_workbook(workbook):
+    """Save a workbook into an in-memory buffer at ZIP_LEVEL compression, ready for download"""
+    # workbook.save would add a sheet to an empty workbook, so do the same here
+    if not workbook.worksheets:
+        workbook.create_sheet()
+
+    # workbook.save has no compression setting, so the archive goes to openpyxl's
+    # ExcelWriter directly; that class is not public API and may change between releases
+    output = io.BytesIO()
+    archive = ZipFile(output, 'w', ZIP_DEFLATED, allowZip64=True, compresslevel=ZIP_LEVEL)
+    ExcelWriter(workbook, archive).save()
+    output.seek(0)
+    return output
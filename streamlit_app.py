@@ -6,172 +6,252 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
 import json
+import re
 import openpyxl
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ERROR_CODES
 from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.utils import get_column_letter
-
-def safe_numeric_convert(value):
-    """Safely convert a value to numeric, returning None if not possible"""
-    if pd.isna(value):
-        return None
+from pd_workbook import HEADERS, COLUMN_LETTERS, METRIC_KEYS, get_metrics, save_workbook
+
+# Styles for the title, header and parent name cells, built once at import
+BOLD = Font(bold=True)
+CENTER = Alignment(horizontal='center')
+YELLOW = PatternFill(start_color='FFFFFFCC', end_color='FFFFFFCC', fill_type='solid')
+
+# Thousands separators and percent signs stripped before numeric conversion
+_STRIP_RE = re.compile(r'[,%]')
+
+def safe_numeric_convert_array(values):
+    """Convert a 2-D block of cell values to floats in one pass, NaN where not possible"""
+    cells = pd.Series(values.ravel())
+    numbers = pd.to_numeric(cells, errors='coerce').astype(float)
+    # Only non-blank cells that failed the direct conversion need the text cleaning
+    retry = numbers.isna() & cells.notna()
+    if retry.any():
+        cleaned = cells[retry].astype(str).str.replace(_STRIP_RE, '', regex=True)
+        numbers[retry] = pd.to_numeric(cleaned, errors='coerce')
+    return numbers.to_numpy().reshape(values.shape)
+
+# Text that pd.read_excel reads as missing by default. openpyxl's values_only read
+# returns these, and Excel error values such as '#N/A', as plain strings.
+_NA_TEXT = frozenset((
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+    'n/a', 'nan', 'null'
+)).union(ERROR_CODES)
+
+def _cell_text(value):
+    """Return the stripped text of a cell, or an empty string for a blank one"""
+    if value is None or value != value or value in _NA_TEXT:
+        return ""
+    return str(value).strip()
+
+# Legacy .xls files are OLE2 compound documents and start with this signature
+_XLS_SIGNATURE = b'\xd0\xcf\x11\xe0'
+
+def list_sheet_names(file_bytes):
+    """List the sheet names of an uploaded workbook"""
+    if file_bytes.startswith(_XLS_SIGNATURE):
+        return pd.ExcelFile(io.BytesIO(file_bytes)).sheet_names
+
+    # Read-only mode leaves the sheet data itself unread
+    workbook = openpyxl.load_workbook(io.BytesIO(file_bytes), read_only=True)
+    try:
+        # Chartsheets have no cells, and pd.ExcelFile never listed them either
+        return [worksheet.title for worksheet in workbook.worksheets]
+    finally:
+        workbook.close()
+
+def read_sheet_rows(file_bytes, sheet_name):
+    """Read the first nine columns of one sheet as a list of value tuples"""
+    if file_bytes.startswith(_XLS_SIGNATURE):
+        # openpyxl cannot open legacy .xls files, so those still go through pandas.
+        # Only the first nine columns are kept and dtype inference is skipped; a
+        # callable is used because range(9) is rejected on narrower sheets.
+        df_raw = pd.read_excel(io.BytesIO(file_bytes), sheet_name=sheet_name, header=None,
+                               usecols=lambda col: col < 9, dtype=object)
+        return list(df_raw.reindex(columns=range(9)).itertuples(index=False, name=None))
+
+    # Read-only mode streams the rows without building a DataFrame
+    workbook = openpyxl.load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
     try:
-        if isinstance(value, str):
-            value = value.replace(',', '').replace('%', '')
-        return float(value)
-    except (ValueError, TypeError):
-        return None
-
-def process_excel_to_json(df_raw):
-    """Convert semi-structured Excel to JSON format"""
+        return list(workbook[sheet_name].iter_rows(min_col=1, max_col=9, values_only=True))
+    finally:
+        workbook.close()
+
+def _classify_rows(name_terms, lgds, numbers):
+    """Flag parent rows and term rows with metrics as boolean masks over the data rows"""
+    has_name = np.fromiter(map(bool, name_terms), dtype=bool, count=len(name_terms))
+    has_lgd = np.fromiter(map(bool, lgds), dtype=bool, count=len(lgds))
+    is_parent = has_name & ~has_lgd
+    # A term row needs a non-zero value in one of the first three metric columns
+    has_metrics = (np.nan_to_num(numbers[:, :3]) != 0).any(axis=1)
+    return is_parent, ~is_parent & has_metrics
+
+def process_excel_to_json(rows):
+    """Convert semi-structured Excel rows (nine-value tuples) to JSON format"""
+    # Lay the rows out once as a plain object array
+    values = np.array(rows, dtype=object).reshape(-1, 9)
+    names = values[:, 0]
+
     # Find the category row
     quality_row = None
-    for idx, row in df_raw.iterrows():
-        if 'Quality' in str(row.iloc[0]):
+    for idx, name in enumerate(names):
+        if 'Quality' in str(name):
             quality_row = idx
-            category = str(row.iloc[0]).strip()
+            category = str(name).strip()
             break
     
     if quality_row is None:
         raise ValueError("Could not find Quality category")
 
-    # Initialize structure
-    json_data = {
-        "category": category,
-        "entries": []
-    }
+    # Collect entries in a flat list; the result dict is assembled once at the end
+    entries = []
 
     # Start processing after header row
     header_row = quality_row + 1
     data_start = header_row + 1
 
+    # Convert every metric cell up front instead of cell by cell in the loop
+    data = values[data_start:]
+    numbers = safe_numeric_convert_array(data[:, 2:9])
+    # Blank metrics become None for the whole block at once, not per value in the loop
+    metric_block = numbers.astype(object)
+    metric_block[np.isnan(numbers)] = None
+    metric_rows = metric_block.tolist()
+
+    # Extract columns
+    name_terms = [_cell_text(name) for name in data[:, 0]]
+    lgds = [_cell_text(lgd) for lgd in data[:, 1]]
+    is_parent, is_term = _classify_rows(name_terms, lgds, numbers)
+
     # Variables to track current parent and subcategory
     current_parent_entry = None
 
-    # Process rows
-    for i in range(data_start, len(df_raw)):
-        row = df_raw.iloc[i]
-        
-        # Skip empty rows
-        if row.isna().all():
-            continue
+    # Only parent and term rows are visited; blank and metric-less rows are skipped up front
+    parent_flags = is_parent.tolist()
+    for i in np.flatnonzero(is_parent | is_term).tolist():
+        col_name_term = name_terms[i]
 
-        # Extract columns
-        col_name_term = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else ""
-        col_lgd = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else ""
-        
         # Check for parent row
-        if col_name_term and not col_lgd:
+        if parent_flags[i]:
             current_parent_entry = {
                 "name": col_name_term,
                 "terms": []
             }
-            json_data["entries"].append(current_parent_entry)
-            continue
-        
-        # Check for metrics
-        percent_rr_used = safe_numeric_convert(row.iloc[2])
-        if not any([percent_rr_used, 
-                    safe_numeric_convert(row.iloc[3]), 
-                    safe_numeric_convert(row.iloc[4])]):
+            entries.append(current_parent_entry)
             continue
 
         # Build metrics
-        metrics = {
-            "percentRRUsed": percent_rr_used,
-            "percentAGGUsed": safe_numeric_convert(row.iloc[3]),
-            "used": safe_numeric_convert(row.iloc[4]),
-            "available": safe_numeric_convert(row.iloc[5]),
-            "totalExposure": safe_numeric_convert(row.iloc[6]),
-            "percentTERR": safe_numeric_convert(row.iloc[7]),
-            "percentTEAGG": safe_numeric_convert(row.iloc[8])
-        }
+        metrics = dict(zip(METRIC_KEYS, metric_rows[i]))
 
         entry_dict = {
             "term": col_name_term,
-            "lgd": col_lgd,
+            "lgd": lgds[i],
             "metrics": metrics
         }
 
         if current_parent_entry:
             current_parent_entry["terms"].append(entry_dict)
         else:
-            json_data["entries"].append(entry_dict)
+            entries.append(entry_dict)
+
+    return {
+        "category": category,
+        "entries": entries
+    }
 
-    return json_data
+def _header_row(ws):
+    """Build the bold, centred header row as cells bound to the worksheet"""
+    cells = [WriteOnlyCell(ws, value=header) for header in HEADERS]
+    for cell in cells:
+        cell.font = BOLD
+        cell.alignment = CENTER
+    return cells
+
+def _parent_row(ws, name):
+    """Build a highlighted parent name row; the caller merges it across all nine columns"""
+    # A merged range is drawn with its top-left cell's style, so only that cell is written
+    cell = WriteOnlyCell(ws, value=name)
+    cell.fill = YELLOW
+    return [cell]
+
+def _write_sheet(workbook, title, json_data):
+    """Add one formatted PD sheet to a write-only workbook"""
+    worksheet = workbook.create_sheet(title=title)
+
+    # Write-only sheets take column widths only before the first append
+    for letter in COLUMN_LETTERS:
+        worksheet.column_dimensions[letter].width = 15
+
+    # Write category
+    category_cell = WriteOnlyCell(worksheet, value=json_data["category"])
+    category_cell.font = BOLD
+    worksheet.append([category_cell])
+    worksheet.merged_cells.add("A1:I1")
+
+    # Header
+    worksheet.append(_header_row(worksheet))
+
+    # Write entries
+    current_row = 3
+    for entry in json_data["entries"]:
+        if "name" in entry:
+            # Parent name row
+            worksheet.append(_parent_row(worksheet, entry["name"]))
+            worksheet.merged_cells.add(f"A{current_row}:I{current_row}")
+            current_row += 1
+
+        # Sub rows
+        for term in entry.get("terms", []):
+            metrics = term["metrics"]
+            worksheet.append((term["term"], term["lgd"]) + get_metrics(metrics))
+            current_row += 1
 
 def create_excel_from_json(json_data):
     """Create formatted Excel from JSON data"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        workbook = writer.book
-
-        # Ensure there is at least one visible sheet
-        if not workbook.active:
-            workbook.create_sheet(title="Sheet1")
-        worksheet = workbook.active
-        worksheet.title = "Sheet1"
-
-        # Write category
-        worksheet.append([json_data["category"]])
-        worksheet.merge_cells(start_row=1, start_column=1, end_row=1, end_column=9)
-        worksheet.cell(row=1, column=1).font = Font(bold=True)
-
-        # Header
-        headers = [
-            "Name/Term", "LGD", "% RR Used", "% AGG Used", "Used", 
-            "Available", "Total Exposure", "% TE of RR", "% TE of AGG"
-        ]
-        worksheet.append(headers)
-        for col_num, header in enumerate(headers, 1):
-            cell = worksheet.cell(row=2, column=col_num, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-
-        # Write entries
-        current_row = 3
-        for entry in json_data["entries"]:
-            if "name" in entry:
-                # Parent name row
-                worksheet.append([entry["name"]])
-                worksheet.merge_cells(start_row=current_row, start_column=1, 
-                                      end_row=current_row, end_column=9)
-                for col_num in range(1, 10):
-                    worksheet.cell(row=current_row, column=col_num).fill = PatternFill(
-                        start_color='FFFFCC', 
-                        end_color='FFFFCC', 
-                        fill_type='solid'
-                    )
-                current_row += 1
-
-            # Sub rows
-            for term in entry.get("terms", []):
-                metrics = term["metrics"]
-                row_data = [
-                    term["term"],
-                    term["lgd"],
-                    metrics.get("percentRRUsed"),
-                    metrics.get("percentAGGUsed"),
-                    metrics.get("used"),
-                    metrics.get("available"),
-                    metrics.get("totalExposure"),
-                    metrics.get("percentTERR"),
-                    metrics.get("percentTEAGG")
-                ]
-                worksheet.append(row_data)
-                current_row += 1
-
-        # Adjust column widths
-        for col_num in range(1, 10):
-            worksheet.column_dimensions[get_column_letter(col_num)].width = 15
-
-        # Ensure all sheets are visible
-        for sheet in workbook.sheetnames:
-            workbook[sheet].sheet_state = 'visible'
-
-    output.seek(0)
-    return output
+    # Write-only mode streams each appended row straight to XML
+    workbook = Workbook(write_only=True)
+    _write_sheet(workbook, "Sheet1", json_data)
+    return save_workbook(workbook)
+
+def create_multi_sheet_xlsx(sheets):
+    """Create one formatted Excel workbook with a sheet per parsed PD sheet"""
+    # A single workbook shares its styles table and zip container across sheets
+    workbook = Workbook(write_only=True)
+    for sheet_name, json_data in sheets.items():
+        _write_sheet(workbook, sheet_name, json_data)
+    return save_workbook(workbook)
+
+@st.cache_data(show_spinner=False)
+def _list_sheets(file_bytes):
+    """List the sheet names of the upload, cached on the file contents"""
+    return list_sheet_names(file_bytes)
+
+@st.cache_data(show_spinner=False)
+def _parse_sheet(file_bytes, sheet_name):
+    """Parse one sheet of the upload as (json_data, error), cached on the file contents and sheet name"""
+    # Each sheet opens the workbook itself so it can be cached on its own; read errors are
+    # returned like parse errors, so a bad sheet is reported alone and its message cached
+    try:
+        rows = read_sheet_rows(file_bytes, sheet_name)
+        return process_excel_to_json(rows), None
+    except Exception as e:
+        return None, str(e)
+
+@st.cache_data(show_spinner=False)
+def _build_xlsx(json_data):
+    """Build the formatted workbook bytes, cached on the parsed sheet"""
+    return create_excel_from_json(json_data).getvalue()
+
+@st.cache_data(show_spinner=False)
+def _build_multi_xlsx(sheets):
+    """Build the combined workbook bytes, cached on the parsed sheets"""
+    return create_multi_sheet_xlsx(sheets).getvalue()
 
 def main():
     st.title("Excel PD Sheet Processor")
@@ -181,8 +261,9 @@ def main():
 
     if uploaded_file:
         try:
-            excel_file = pd.ExcelFile(uploaded_file)
-            sheet_names = excel_file.sheet_names
+            # Raw bytes double as the cache key for the parsing and writing steps
+            file_bytes = uploaded_file.getvalue()
+            sheet_names = _list_sheets(file_bytes)
 
             st.info(f"Found {len(sheet_names)} sheets in the workbook")
 
@@ -193,26 +274,36 @@ def main():
             )
 
             if st.button("Process Selected Sheets"):
+                processed_sheets = {}
                 for sheet_name in selected_sheets:
-                    try:
-                        df_raw = pd.read_excel(uploaded_file, 
-                                               sheet_name=sheet_name, 
-                                               header=None)
-
-                        # Convert to JSON
-                        json_data = process_excel_to_json(df_raw)
+                    # Convert to JSON; cached per sheet, so changing the selection only parses new sheets
+                    json_data, parse_error = _parse_sheet(file_bytes, sheet_name)
+                    if parse_error is not None:
+                        st.error(f"Error processing sheet '{sheet_name}': {parse_error}")
+                        continue
 
+                    try:
                         # Create Excel
-                        excel_data = create_excel_from_json(json_data)
+                        excel_data = _build_xlsx(json_data)
                         st.download_button(
                             label=f"Download {sheet_name}",
                             data=excel_data,
                             file_name=f"{sheet_name}_formatted.xlsx",
                             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                         )
+                        processed_sheets[sheet_name] = json_data
 
                     except Exception as e:
                         st.error(f"Error processing sheet '{sheet_name}': {str(e)}")
+
+                # Offer every processed sheet as one workbook as well
+                if len(processed_sheets) > 1:
+                    st.download_button(
+                        label="Download all processed sheets",
+                        data=_build_multi_xlsx(processed_sheets),
+                        file_name="formatted_sheets.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
         except Exception as e:
             st.error(f"Error reading Excel file: {str(e)}")
 
@@ -5,126 +5,113 @@
 
 
 import streamlit as st
-import pandas as pd
 import json
+import orjson
 import io
-from openpyxl.styles import PatternFill, Font, Border, Side
-from openpyxl.utils import get_column_letter
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Border, Side, Alignment, NamedStyle
+from pd_workbook import HEADERS, COLUMN_LETTERS, METRIC_KEYS, get_metrics, save_workbook
+
+# Building blocks for the named styles registered on each workbook
+BOLD = Font(bold=True)
+YELLOW = PatternFill(start_color='FFFFEB9C', end_color='FFFFEB9C', fill_type='solid')
+THIN = Side(style='thin')
+BORDER = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
+CENTER = Alignment(horizontal='center')
+# Named styles, registered once per workbook: the title, column headers, company rows,
+# plain text, percentages and whole-number amounts
+HEADING_STYLE = 'heading'
+HEADER_STYLE = 'column_header'
+COMPANY_STYLE = 'company'
+TEXT_STYLE = 'data_text'
+PERCENT_STYLE = 'data_percent'
+NUMBER_STYLE = 'data_number'
+
+# Named style per column for data rows
+DATA_STYLES = (
+    TEXT_STYLE, TEXT_STYLE, PERCENT_STYLE, PERCENT_STYLE, NUMBER_STYLE,
+    NUMBER_STYLE, NUMBER_STYLE, PERCENT_STYLE, PERCENT_STYLE
+)
+
+# Empty LGD and metric cells that follow the name on a company row
+_BLANK_COLUMNS = ('',) * 8
+
+def _metric_row(term, lgd, metrics):
+    """Build one data row from a term, its LGD and its metrics"""
+    return (term, lgd) + get_metrics(metrics)
+
+def _column_widths(category, rows):
+    """Width per column from the longest header, title or value text, capped at 30"""
+    widths = [len(header) for header in HEADERS]
+    widths[0] = max(widths[0], len(str(category)))
+    for col, values in enumerate(zip(*rows)):
+        for value in values:
+            if value is None or value != value:  # Blank or NaN
+                continue
+            widths[col] = max(widths[col], len(str(value)))
+    return [min(width + 2, 30) for width in widths]
+
+def _add_named_styles(workbook):
+    """Register the heading, header, company, text, percentage and amount styles on a workbook"""
+    workbook.add_named_style(NamedStyle(name=HEADING_STYLE, font=BOLD, border=BORDER))
+    # Column headers are centred, as pandas' to_excel used to write them
+    workbook.add_named_style(NamedStyle(name=HEADER_STYLE, font=BOLD, border=BORDER, alignment=CENTER))
+    workbook.add_named_style(NamedStyle(name=COMPANY_STYLE, font=BOLD, fill=YELLOW, border=BORDER))
+    workbook.add_named_style(NamedStyle(name=TEXT_STYLE, border=BORDER))
+    workbook.add_named_style(NamedStyle(name=PERCENT_STYLE, number_format='0.00%', border=BORDER))
+    workbook.add_named_style(NamedStyle(name=NUMBER_STYLE, number_format='#,##0', border=BORDER))
+
+def _named_cell(ws, style, value=None):
+    """Create a write-only cell in one of the workbook's named styles"""
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
 
 def create_styled_excel(processed_data):
     """Create Excel file with matching styles from the screenshot."""
-    output = io.BytesIO()
+    # Write-only mode streams each row to XML as it is appended, styles included
+    workbook = Workbook(write_only=True)
+    # Styled cells refer to one named style instead of carrying each attribute separately
+    _add_named_styles(workbook)
     
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        for sheet_name, data in processed_data.items():
-            # Convert the data to rows
-            rows = []
-            for entry in data['entries']:
-                # Add the company name row
-                rows.append({
-                    'Name/Term': entry['name'],
-                    'LGD': '',
-                    '% RR Used': '',
-                    '% AGG Used': '',
-                    'Used': '',
-                    'Available': '',
-                    'Total Exposure': '',
-                    '% TE of RR': '',
-                    '% TE of AGG': ''
-                })
-                
-                # Add the metrics row
-                if entry['metrics']:
-                    rows.append({
-                        'Name/Term': entry['term'] or '',
-                        'LGD': entry['lgd'],
-                        '% RR Used': entry['metrics']['percentRRUsed'],
-                        '% AGG Used': entry['metrics']['percentAGGUsed'],
-                        'Used': entry['metrics']['used'],
-                        'Available': entry['metrics']['available'],
-                        'Total Exposure': entry['metrics']['totalExposure'],
-                        '% TE of RR': entry['metrics']['percentTERR'],
-                        '% TE of AGG': entry['metrics']['percentTEAGG']
-                    })
-                
-                # Add sub-entries
-                for sub in entry.get('sub_entries', []):
-                    rows.append({
-                        'Name/Term': sub['term'],
-                        'LGD': sub['lgd'],
-                        '% RR Used': sub['metrics']['percentRRUsed'],
-                        '% AGG Used': sub['metrics']['percentAGGUsed'],
-                        'Used': sub['metrics']['used'],
-                        'Available': sub['metrics']['available'],
-                        'Total Exposure': sub['metrics']['totalExposure'],
-                        '% TE of RR': sub['metrics']['percentTERR'],
-                        '% TE of AGG': sub['metrics']['percentTEAGG']
-                    })
-            
-            # Create DataFrame and write to Excel
-            df = pd.DataFrame(rows)
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-            
-            # Get the workbook and the worksheet
-            workbook = writer.book
-            worksheet = writer.sheets[sheet_name]
+    for sheet_name, data in processed_data.items():
+        # Convert the data to rows of plain tuples in column order
+        rows = []
+        for entry in data['entries']:
+            # Add the company name row
+            rows.append((entry['name'],) + _BLANK_COLUMNS)
             
-            # Add title row
-            worksheet.insert_rows(1)
-            worksheet['A1'] = data['category']
-            worksheet['A1'].font = Font(bold=True)
+            # Add the metrics row
+            if entry['metrics']:
+                rows.append(_metric_row(entry['term'] or '', entry['lgd'], entry['metrics']))
             
-            # Define styles
-            yellow_fill = PatternFill(start_color='FFEB9C',
-                                      end_color='FFEB9C',
-                                      fill_type='solid')
-            thin_border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-            
-            # Apply formatting
-            for row_idx, row in enumerate(rows, start=3):  # Start after title + header
-                # Highlight company rows
-                if row['LGD'] == '':  # Company row (LGD empty)
-                    for col in range(1, worksheet.max_column + 1):
-                        cell = worksheet.cell(row=row_idx, column=col)
-                        cell.fill = yellow_fill
-                        cell.font = Font(bold=True)
-                
-                # Data row
-                else:
-                    # Format percentages in columns 3, 4, 8, 9
-                    for col in [3, 4, 8, 9]:
-                        cell = worksheet.cell(row=row_idx, column=col)
-                        cell.number_format = '0.00%'
-                    
-                    # Format numbers in columns 5, 6, 7
-                    for col in [5, 6, 7]:
-                        cell = worksheet.cell(row=row_idx, column=col)
-                        cell.number_format = '#,##0'
-            
-            # Apply borders to all cells
-            for row in worksheet.iter_rows(min_row=1, max_row=len(rows) + 2):
-                for cell in row:
-                    cell.border = thin_border
+            # Add sub-entries
+            for sub in entry.get('sub_entries', []):
+                rows.append(_metric_row(sub['term'], sub['lgd'], sub['metrics']))
+        
+        worksheet = workbook.create_sheet(title=sheet_name)
+        
+        # Widths come from the measured rows, so they are known before the title row goes out
+        for letter, width in zip(COLUMN_LETTERS, _column_widths(data['category'], rows)):
+            worksheet.column_dimensions[letter].width = width
+        
+        # Title and header rows
+        worksheet.append([_named_cell(worksheet, HEADING_STYLE, data['category'])]
+                         + [_named_cell(worksheet, TEXT_STYLE) for _ in range(len(HEADERS) - 1)])
+        worksheet.append([_named_cell(worksheet, HEADER_STYLE, header) for header in HEADERS])
+        
+        for row in rows:
+            # Highlight company rows, keeping any metric values they carry
+            if row[1] == '':  # Company row (LGD empty)
+                worksheet.append([_named_cell(worksheet, COMPANY_STYLE, value) for value in row])
             
-            # Adjust column widths
-            for col in worksheet.columns:
-                max_length = 0
-                column_letter = get_column_letter(col[0].column)
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except Exception:
-                        pass
-                worksheet.column_dimensions[column_letter].width = min(max_length + 2, 30)
-
-    output.seek(0)
-    return output
+            # Data row
+            else:
+                worksheet.append([_named_cell(worksheet, style, value)
+                                  for value, style in zip(row, DATA_STYLES)])
+    
+    return save_workbook(workbook)
 
 def main():
     st.title("Excel PD Sheet Processor")
@@ -133,8 +120,14 @@ def main():
     uploaded_file = st.file_uploader("Upload JSON file", type=["json"])
     
     if uploaded_file is not None:
+        raw = uploaded_file.getvalue()
         try:
-            processed_data = json.load(uploaded_file)
+            # orjson parses straight from the uploaded bytes
+            try:
+                processed_data = orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                # orjson rejects NaN/Infinity, a UTF-8 BOM and UTF-16 text, all of which json accepts
+                processed_data = json.loads(raw)
         except json.JSONDecodeError as e:
             st.error(f"Could not decode JSON: {str(e)}")
             return
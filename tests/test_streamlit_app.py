@@ -0,0 +1,109 @@
+import io
+import sys
+from pathlib import Path
+
+import openpyxl
+from openpyxl.chart import BarChart, Reference
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import streamlit_app as app
+
+
+def _pd_sheet_bytes():
+    """Build a small PD sheet with blank rows, text metrics and N/A / error cells"""
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = "PD"
+    for row in (
+        ["Report"],
+        ["Quality 1 - Strong"],
+        list(app.HEADERS),
+        ["Alpha Corp"],
+        ["5Y", "B", 0.25, "12%", "1,200", 800, 2000, 0.1, 0.05],
+        ["3Y", "C", 0, 0, 0, 10, 10, 0, 0],
+        [],
+        ["Gamma", "#N/A"],  # Error cell
+        ["7Y", "N/A", 0.5, 0.4, 300, None, 300, 0.2, "#DIV/0!"],  # Text N/A
+        ["Revolver", "D", None, 0.3, None, 50, None, None, None],
+    ):
+        worksheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+# Output of the original pd.read_excel based parser on the sheet above
+EXPECTED = {
+    "category": "Quality 1 - Strong",
+    "entries": [
+        {"name": "Alpha Corp", "terms": [
+            {"term": "5Y", "lgd": "B", "metrics": {
+                "percentRRUsed": 0.25, "percentAGGUsed": 12.0, "used": 1200.0,
+                "available": 800.0, "totalExposure": 2000.0,
+                "percentTERR": 0.1, "percentTEAGG": 0.05}},
+        ]},
+        {"name": "Gamma", "terms": []},
+        {"name": "7Y", "terms": [
+            {"term": "Revolver", "lgd": "D", "metrics": {
+                "percentRRUsed": None, "percentAGGUsed": 0.3, "used": None,
+                "available": 50.0, "totalExposure": None,
+                "percentTERR": None, "percentTEAGG": None}},
+        ]},
+    ],
+}
+
+
+def test_process_excel_to_json_matches_pandas_parser():
+    rows = app.read_sheet_rows(_pd_sheet_bytes(), "PD")
+    assert app.process_excel_to_json(rows) == EXPECTED
+
+
+def test_list_sheet_names_skips_chartsheets():
+    workbook = openpyxl.load_workbook(io.BytesIO(_pd_sheet_bytes()))
+    chart = BarChart()
+    chart.add_data(Reference(workbook["PD"], min_col=3, min_row=5, max_row=6))
+    workbook.create_chartsheet("Chart", 0).add_chart(chart)
+    output = io.BytesIO()
+    workbook.save(output)
+    assert app.list_sheet_names(output.getvalue()) == ["PD"]
+
+
+def test_parse_sheet_returns_read_errors_per_sheet():
+    file_bytes = _pd_sheet_bytes()
+    assert app._parse_sheet(file_bytes, "PD") == (EXPECTED, None)
+    json_data, error = app._parse_sheet(file_bytes, "Missing")
+    assert json_data is None and "Missing" in error
+
+
+def test_create_excel_from_json_layout_and_styles():
+    worksheet = openpyxl.load_workbook(app.create_excel_from_json(EXPECTED))["Sheet1"]
+
+    assert worksheet["A1"].value == "Quality 1 - Strong"
+    assert worksheet["A1"].font.b
+    header = worksheet[2]
+    assert tuple(cell.value for cell in header) == app.HEADERS
+    assert all(cell.font.b and cell.alignment.horizontal == "center" for cell in header)
+
+    # Title and parent name rows are merged across all nine columns
+    assert sorted(str(merged) for merged in worksheet.merged_cells.ranges) == [
+        "A1:I1", "A3:I3", "A5:I5", "A6:I6"]
+    for row, name in ((3, "Alpha Corp"), (5, "Gamma"), (6, "7Y")):
+        cell = worksheet.cell(row=row, column=1)
+        assert cell.value == name
+        assert cell.fill.fgColor.rgb == "FFFFFFCC"
+
+    assert [cell.value for cell in worksheet[4]] == [
+        "5Y", "B", 0.25, 12, 1200, 800, 2000, 0.1, 0.05]
+    assert [cell.value for cell in worksheet[7]] == [
+        "Revolver", "D", None, 0.3, None, 50, None, None, None]
+    assert worksheet.max_row == 7
+    assert all(worksheet.column_dimensions[letter].width == 15 for letter in "ABCDEFGHI")
+
+
+def test_create_multi_sheet_xlsx_titles():
+    second = {"category": "Quality 2", "entries": []}
+    workbook = openpyxl.load_workbook(app.create_multi_sheet_xlsx({"PD": EXPECTED, "PD 2": second}))
+    assert workbook.sheetnames == ["PD", "PD 2"]
+    assert workbook["PD 2"]["A1"].value == "Quality 2"
+    assert workbook["PD"]["A3"].value == "Alpha Corp"
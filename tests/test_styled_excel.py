@@ -0,0 +1,74 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import openpyxl
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The JSON app's file name is not importable as a module, so load it from its path
+_spec = importlib.util.spec_from_file_location(
+    "styled_excel_app", Path(__file__).resolve().parent.parent / "streamlit_app.py.py")
+app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(app)
+
+
+def _metrics(*values):
+    return dict(zip(app.METRIC_KEYS, values))
+
+
+PROCESSED_DATA = {
+    "PD One": {"category": "Quality 2 - Good", "entries": [
+        {"name": "Acme Corp", "term": "5Y", "lgd": "B",
+         "metrics": _metrics(0.5, 0.25, 1200, 800, 2000, 0.1, 0.05),
+         "sub_entries": [
+             {"term": "3Y", "lgd": "", "metrics": _metrics(0.1, 0.2, 10, 20, 30, 0.3, 0.4)},
+         ]},
+        {"name": "Beta", "term": None, "lgd": "", "metrics": {}},
+    ]},
+    "PD Two": {"category": "Quality 3", "entries": []},
+}
+
+
+def _load(processed_data):
+    return openpyxl.load_workbook(app.create_styled_excel(processed_data))
+
+
+def test_sheets_title_and_header():
+    workbook = _load(PROCESSED_DATA)
+    assert workbook.sheetnames == ["PD One", "PD Two"]
+    worksheet = workbook["PD One"]
+    assert worksheet["A1"].value == "Quality 2 - Good"
+    assert worksheet["A1"].font.b
+    header = worksheet[2]
+    assert tuple(cell.value for cell in header) == app.HEADERS
+    assert all(cell.font.b and cell.alignment.horizontal == "center" for cell in header)
+    assert all(cell.border.left.style == "thin" for cell in header)
+
+
+def test_company_and_data_rows():
+    worksheet = _load(PROCESSED_DATA)["PD One"]
+    rows = [[cell.value for cell in row] for row in worksheet.iter_rows(min_row=3)]
+    assert rows[0][0] == "Acme Corp"
+    assert rows[1] == ["5Y", "B", 0.5, 0.25, 1200, 800, 2000, 0.1, 0.05]
+    assert rows[3][0] == "Beta"
+
+    company = worksheet[3]
+    assert all(cell.font.b and cell.fill.fgColor.rgb == "FFFFEB9C" for cell in company)
+
+    data = worksheet[4]
+    assert [cell.number_format for cell in data[2:]] == [
+        "0.00%", "0.00%", "#,##0", "#,##0", "#,##0", "0.00%", "0.00%"]
+    assert all(cell.border.left.style == "thin" for cell in data)
+
+
+def test_rows_with_blank_lgd_keep_their_metrics():
+    worksheet = _load(PROCESSED_DATA)["PD One"]
+    # A sub-entry with an empty LGD is highlighted like a company row but keeps its values
+    row = worksheet[5]
+    assert [cell.value for cell in row][2:] == [0.1, 0.2, 10, 20, 30, 0.3, 0.4]
+    assert row[0].value == "3Y" and row[2].fill.fgColor.rgb == "FFFFEB9C"
+
+
+def test_empty_input_still_yields_a_workbook():
+    assert len(_load({}).worksheets) == 1